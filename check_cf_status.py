@@ -1,35 +1,133 @@
 from boto3 import client
+from botocore.exceptions import ClientError
 import argparse
 from time import sleep
 
 parser = argparse.ArgumentParser()
-parser.add_argument('stack_name', help='The CloudFormation stack name to check.')
+parser.add_argument('stack_names', nargs='+', help='The CloudFormation stack names (or IDs) to check.')
 args = parser.parse_args()
 
-cf_stack_name = str(args.stack_name)
+# Drop repeated names while keeping the given order, so each stack is only checked once per tick.
+cf_stack_names = []
+for stack_name in args.stack_names:
+    if str(stack_name) not in cf_stack_names:
+        cf_stack_names.append(str(stack_name))
 
 cf_client = client('cloudformation')
 
+SUCCESS_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'DELETE_COMPLETE', 'IMPORT_COMPLETE']
+
 def main():
-    status = get_stack_status(cf_client, cf_stack_name)
-    print(status)
+    # Last known status and stack ID of every watched stack, keyed by the name given on the command line.
+    statuses = {}
+    stack_ids = {}
+    last_event_ids = {}
 
     while True:
-        if 'UPDATE_IN_PROGRESS' in status:
-            sleep(30)
-            status = get_stack_status(cf_client, cf_stack_name)
+        stacks = get_stacks(cf_client, cf_stack_names)
+
+        for stack_name in cf_stack_names:
+            if stack_name in statuses and not is_in_progress(statuses[stack_name]):
+                continue
+
+            stack = stacks.get(stack_name)
+            if stack is None and stack_name not in stack_ids:
+                # A stack never seen in the listing may be a deleted stack given by its stack ID,
+                # so describe it directly before declaring it missing.
+                stack = get_stack(cf_client, stack_name)
+
+            if stack is None:
+                # describe_stacks without a StackName omits deleted stacks, so a stack we have
+                # already seen that drops out of the listing has finished deleting.
+                if stack_name in stack_ids:
+                    status = 'DELETE_COMPLETE'
+                else:
+                    status = 'DOES_NOT_EXIST'
+            else:
+                stack_ids[stack_name] = stack['StackId']
+                status = stack['StackStatus']
+
+            if stack_name in stack_ids:
+                events, last_event_ids[stack_name] = get_new_stack_events(
+                    cf_client, stack_ids[stack_name], last_event_ids.get(stack_name))
+                for event in events:
+                    print_event(stack_name, event)
+
+            if status != statuses.get(stack_name):
+                print('{}: {}'.format(stack_name, status))
+            statuses[stack_name] = status
 
-        elif 'UPDATE_COMPLETE' in status:
-            print(status)
+        if not any(is_in_progress(status) for status in statuses.values()):
             break
 
-        else:
-            print(status)
-            exit(1)
+        sleep(30)
+
+    print_summary(statuses)
+
+    if any(status not in SUCCESS_STATUSES for status in statuses.values()):
+        exit(1)
+
+
+def get_stacks(client, stack_names):
+    # A single paginated listing per tick is cheaper than one describe_stacks call per stack.
+    stacks = {}
+    paginator = client.get_paginator('describe_stacks')
+    for page in paginator.paginate():
+        for stack in page['Stacks']:
+            for stack_name in stack_names:
+                if stack_name in (stack['StackName'], stack['StackId']):
+                    stacks[stack_name] = stack
+
+    return stacks
+
+
+def get_stack(client, stack_name):
+    try:
+        return client.describe_stacks(StackName=stack_name)['Stacks'][0]
+    except ClientError as error:
+        error_details = error.response['Error']
+        if error_details['Code'] == 'ValidationError' and 'does not exist' in error_details['Message']:
+            return None
+        raise
+
+
+def get_new_stack_events(client, stack_id, last_event_id):
+    # Events are returned newest first, so stop paging as soon as the last seen event turns up.
+    # Without a last seen event only the newest event is used as the starting point.
+    new_events = []
+    paginator = client.get_paginator('describe_stack_events')
+    for page in paginator.paginate(StackName=stack_id):
+        for event in page['StackEvents']:
+            if last_event_id is None:
+                return [], event['EventId']
+            if event['EventId'] == last_event_id:
+                return list(reversed(new_events)), (new_events[0]['EventId'] if new_events else last_event_id)
+            new_events.append(event)
+
+    return list(reversed(new_events)), (new_events[0]['EventId'] if new_events else last_event_id)
+
+
+def is_in_progress(status):
+    # REVIEW_IN_PROGRESS only means a change set is waiting to be executed, which may never
+    # happen, so it is reported as a final (failed) state instead of being polled forever.
+    return status.endswith('_IN_PROGRESS') and status != 'REVIEW_IN_PROGRESS'
+
+
+def print_event(stack_name, event):
+    print('{}: {} {} {} {}'.format(
+        stack_name,
+        event['Timestamp'],
+        event['LogicalResourceId'],
+        event['ResourceStatus'],
+        event.get('ResourceStatusReason', '')
+    ).rstrip())
+
 
+def print_summary(statuses):
+    print('Stack summary:')
+    for stack_name in sorted(statuses):
+        print('  {}: {}'.format(stack_name, statuses[stack_name]))
 
-def get_stack_status(client, stack_name):
-    return client.describe_stacks(StackName=stack_name)['Stacks'][0]['StackStatus']
 
 if __name__ == "__main__":
     main()
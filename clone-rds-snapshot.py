@@ -5,8 +5,17 @@
 # Also requires an IAM role created on cloned AWS account with the following permissions
 # "rds:DeleteDbInstance", rds:"RestoreDbInstance", rds:"DescribeDBInstances", rds:"ModifyDbInstance"
 # This Role will be assumed by the script to create an RDS instance on the cloned AWS account.
-
-from boto3 import client
+#
+# Run with no arguments to refresh the single clone defined by the constants below, or pass
+# --mappings with a file of "<source instance id> <clone instance id>" lines to refresh many
+# clones concurrently. Each source is snapshotted once and restored to all of its clones.
+# Every clone must live in CLONE_AWS_ACCOUNT_ID and share CLONE_MASTER_PASSWORD.
+
+import argparse
+from boto3.session import Session
+from botocore.credentials import RefreshableCredentials
+from botocore.session import get_session
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from time import time, sleep
 
 ASSUME_ROLE_ARN =
@@ -17,38 +26,168 @@ SNAPSHOT_NAME = ORIG_DB_INSTANCE_ID + '-' + str(EPOC)
 CLONE_AWS_ACCOUNT_ID =
 CLONE_DB_INSTANCE_ID =
 CLONE_MASTER_PASSWORD =
+DEFAULT_CONCURRENCY = 4
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, got {}'.format(value))
+    return number
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--mappings', help='File of "<source instance id> <clone instance id>" lines to refresh concurrently.')
+parser.add_argument('--concurrency', type=positive_int, default=DEFAULT_CONCURRENCY,
+                    help='Maximum number of clones refreshed at once (default: {}).'.format(DEFAULT_CONCURRENCY))
+args = parser.parse_args()
+
 
 def main():
-    prod_rds_client = client('rds')
-    assumed_creds = assume_role(ASSUME_ROLE_ARN, 'rds_staging_role')
-    assumed_rds_client = client('rds',
-        aws_access_key_id=assumed_creds['AccessKeyId'],
-        aws_secret_access_key=assumed_creds['SecretAccessKey'],
-        aws_session_token=assumed_creds['SessionToken']
-    )
+    assumed_creds = assumed_role_credentials(ASSUME_ROLE_ARN, 'rds_staging_role')
+    # Low level boto3 clients are thread safe, so both clients are shared by every worker.
+    prod_rds_client = Session().client('rds')
+    assumed_rds_client = refreshable_client('rds', assumed_creds)
+
+    if not args.mappings:
+        try:
+            prepare_snapshot(prod_rds_client, ORIG_DB_INSTANCE_ID, SNAPSHOT_NAME)
+            restore_clone(prod_rds_client, assumed_rds_client, CLONE_DB_INSTANCE_ID, SNAPSHOT_NAME)
+        finally:
+            cleanup_snapshot(prod_rds_client, SNAPSHOT_NAME)
+        return
+
+    mappings = read_mappings(args.mappings)
+    if not mappings:
+        parser.error('no mappings found in {}'.format(args.mappings))
+
+    results = refresh_clones(prod_rds_client, assumed_rds_client, mappings, args.concurrency)
+    print_summary(results)
 
-    original_instance_details = describe_db_instance(assumed_rds_client, CLONE_DB_INSTANCE_ID)
+    if any(result != 'SUCCESS' for result in results.values()):
+        exit(1)
 
-    create_snapshot(prod_rds_client, SNAPSHOT_NAME, ORIG_DB_INSTANCE_ID)
 
-    if wait_snapshot_status(prod_rds_client, SNAPSHOT_NAME, 'available'):
-        share_snapshot(prod_rds_client, SNAPSHOT_NAME, CLONE_AWS_ACCOUNT_ID)
+def prepare_snapshot(prod_rds_client, orig_instance_id, snapshot_name):
+    create_snapshot(prod_rds_client, snapshot_name, orig_instance_id)
 
-    delete_db_instance(assumed_rds_client, CLONE_DB_INSTANCE_ID)
+    if wait_snapshot_status(prod_rds_client, snapshot_name, 'available'):
+        share_snapshot(prod_rds_client, snapshot_name, CLONE_AWS_ACCOUNT_ID)
 
-    if wait_instance_status(assumed_rds_client, CLONE_DB_INSTANCE_ID, 'deleted'):
-        snapshot_arn = describe_snapshot(prod_rds_client, SNAPSHOT_NAME)['DBSnapshotArn']
+
+def restore_clone(prod_rds_client, assumed_rds_client, clone_instance_id, snapshot_name):
+    original_instance_details = describe_db_instance(assumed_rds_client, clone_instance_id)
+
+    delete_db_instance(assumed_rds_client, clone_instance_id)
+
+    if wait_instance_status(assumed_rds_client, clone_instance_id, 'deleted'):
+        snapshot_arn = describe_snapshot(prod_rds_client, snapshot_name)['DBSnapshotArn']
         restore_db_instance(assumed_rds_client, original_instance_details, snapshot_arn)
 
-    if wait_instance_status(assumed_rds_client, CLONE_DB_INSTANCE_ID, 'available', 20):
-        change_master_password(assumed_rds_client, CLONE_DB_INSTANCE_ID, CLONE_MASTER_PASSWORD)
+    if wait_instance_status(assumed_rds_client, clone_instance_id, 'available', 20):
+        change_master_password(assumed_rds_client, clone_instance_id, CLONE_MASTER_PASSWORD)
 
-    delete_db_snapshot(prod_rds_client, SNAPSHOT_NAME)
+
+def cleanup_snapshot(prod_rds_client, snapshot_name):
+    # Returns an error message instead of raising so a failed cleanup never hides the
+    # error that caused it, and so fan-out mode can report snapshots left behind.
+    try:
+        delete_db_snapshot(prod_rds_client, snapshot_name)
+    except prod_rds_client.exceptions.DBSnapshotNotFoundFault:
+        return None
+    except Exception as error:
+        print('Snapshot {} was not deleted: {}'.format(snapshot_name, error))
+        return str(error)
+
+    return None
+
+
+def refresh_clones(prod_rds_client, assumed_rds_client, mappings, concurrency):
+    # An instance can only be snapshotted while it is available, so each source gets a single
+    # snapshot which is shared once and restored to all of its clones before being deleted.
+    clones_by_source = {}
+    for orig_instance_id, clone_instance_id in mappings:
+        clones_by_source.setdefault(orig_instance_id, []).append(clone_instance_id)
+
+    results = {}
+    remaining_clones = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        snapshot_futures = {}
+        for orig_instance_id in clones_by_source:
+            snapshot_name = '{}-{}'.format(orig_instance_id, EPOC)
+            future = executor.submit(prepare_snapshot, prod_rds_client, orig_instance_id, snapshot_name)
+            snapshot_futures[future] = (orig_instance_id, snapshot_name)
+
+        restore_futures = {}
+        for future in as_completed(snapshot_futures):
+            orig_instance_id, snapshot_name = snapshot_futures[future]
+            clone_instance_ids = clones_by_source[orig_instance_id]
+            try:
+                future.result()
+            except Exception as error:
+                for clone_instance_id in clone_instance_ids:
+                    results[clone_instance_id] = 'FAILED: snapshot {}: {}'.format(snapshot_name, error)
+                finish_snapshot(prod_rds_client, snapshot_name, clone_instance_ids, results)
+                continue
+
+            remaining_clones[snapshot_name] = len(clone_instance_ids)
+            for clone_instance_id in clone_instance_ids:
+                restore_future = executor.submit(restore_clone, prod_rds_client, assumed_rds_client,
+                                                 clone_instance_id, snapshot_name)
+                restore_futures[restore_future] = (orig_instance_id, clone_instance_id, snapshot_name)
+
+        for future in as_completed(restore_futures):
+            orig_instance_id, clone_instance_id, snapshot_name = restore_futures[future]
+            try:
+                future.result()
+                results[clone_instance_id] = 'SUCCESS'
+            except Exception as error:
+                results[clone_instance_id] = 'FAILED: {}'.format(error)
+
+            remaining_clones[snapshot_name] -= 1
+            if remaining_clones[snapshot_name] == 0:
+                finish_snapshot(prod_rds_client, snapshot_name, clones_by_source[orig_instance_id], results)
+
+    return results
+
+
+def finish_snapshot(prod_rds_client, snapshot_name, clone_instance_ids, results):
+    cleanup_error = cleanup_snapshot(prod_rds_client, snapshot_name)
+    if cleanup_error:
+        for clone_instance_id in clone_instance_ids:
+            results[clone_instance_id] = '{} (snapshot {} left behind: {})'.format(
+                results[clone_instance_id], snapshot_name, cleanup_error)
+
+
+def read_mappings(mappings_file):
+    mappings = []
+    with open(mappings_file) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+
+            fields = line.split()
+            if len(fields) != 2:
+                raise ValueError('Invalid mapping line: {}'.format(line))
+            mappings.append((fields[0], fields[1]))
+
+    clone_ids = [clone_instance_id for _, clone_instance_id in mappings]
+    if len(clone_ids) != len(set(clone_ids)):
+        raise ValueError('Each clone instance may only appear once in {}'.format(mappings_file))
+
+    return mappings
+
+
+def print_summary(results):
+    print('Refresh summary:')
+    for clone_instance_id in sorted(results):
+        print('  {}: {}'.format(clone_instance_id, results[clone_instance_id]))
 
 
 def assume_role(role_arn, session_name):
     print('Assuming Role: {}'.format(role_arn))
-    sts_client = client('sts')
+    sts_client = Session().client('sts')
 
     creds = sts_client.assume_role(
         RoleArn=role_arn,
@@ -58,6 +197,33 @@ def assume_role(role_arn, session_name):
     return creds
 
 
+def assumed_role_credentials(role_arn, session_name):
+    # Refreshes run for hours, longer than a single set of assumed role credentials lasts,
+    # so botocore calls assume_role again whenever the current credentials are about to expire.
+    def refresh():
+        creds = assume_role(role_arn, session_name)
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].isoformat()
+        }
+
+    return RefreshableCredentials.create_from_metadata(
+        metadata=refresh(),
+        refresh_using=refresh,
+        method='sts-assume-role'
+    )
+
+
+def refreshable_client(service_name, credentials):
+    # botocore has no public way to hand a session ready made refreshable credentials, so
+    # they are set on the session directly. This is the only place that touches _credentials.
+    botocore_session = get_session()
+    botocore_session._credentials = credentials
+    return Session(botocore_session=botocore_session).client(service_name)
+
+
 def change_master_password(client, instance_name, new_password):
     if is_orig(client, instance_name):
         raise ValueError('Do not try to modify production instances!')
@@ -158,26 +324,26 @@ def wait_instance_status(client, instance_id, status, wait_time=5):
     attempts = 0
     while True:
         if attempts > max_attempts:
-            raise RuntimeError('Instance did not enter {} status within {} minutes.'.format(status, wait_time))
+            raise RuntimeError('Instance {} did not enter {} status within {} minutes.'.format(instance_id, status, wait_time))
 
         try:
             instance_details = describe_db_instance(client, instance_id)
             instance_status = instance_details['DBInstanceStatus']
 
             if instance_status != status:
-                print(instance_status)
+                print('{}: {}'.format(instance_id, instance_status))
                 sleep(30)
                 attempts += 1
             else:
-                print(instance_status)
+                print('{}: {}'.format(instance_id, instance_status))
                 return True
 
         except client.exceptions.DBInstanceNotFoundFault:
             if status == 'deleted':
-                print('Instance successfully deleted')
+                print('Instance {} successfully deleted'.format(instance_id))
                 return True
             else:
-                print('Instance does not exist')
+                print('Instance {} does not exist'.format(instance_id))
                 raise
 
 
@@ -186,18 +352,18 @@ def wait_snapshot_status(client, snapshot_name, status, wait_time=5):
     attempts = 0
     while True:
         if attempts > max_attempts:
-            raise RuntimeError('Snapshot did not enter {} status within {} minutes'.format(status, wait_time))
+            raise RuntimeError('Snapshot {} did not enter {} status within {} minutes'.format(snapshot_name, status, wait_time))
 
         try:
             snap_details = describe_snapshot(client, snapshot_name)
             snap_status = snap_details['Status']
 
             if snap_status != status:
-                print(snap_status)
+                print('{}: {}'.format(snapshot_name, snap_status))
                 sleep(30)
                 attempts += 1
             else:
-                print(snap_status)
+                print('{}: {}'.format(snapshot_name, snap_status))
                 return True
 
         except client.exceptions.DBInstanceNotFoundFault:
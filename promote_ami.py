@@ -1,54 +1,119 @@
 from boto3 import client
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
+
 parser = argparse.ArgumentParser()
-parser.add_argument("ami_id", help="The AMI id that you would like to promote.")
-parser.add_argument("account_id", help="The account ID you would like to promote the AMI to.")
+parser.add_argument("ami_ids", help="The AMI id that you would like to promote, or a comma separated list of AMI ids.")
+parser.add_argument("account_ids", help="The account ID you would like to promote the AMI to, or a comma separated list of account IDs.")
+parser.add_argument("--concurrency", type=positive_int, default=8, help="Maximum number of AMIs promoted at once (default: 8).")
 args = parser.parse_args()
 
-ami_id = str(args.ami_id)
-account_id = str(args.account_id)
-client = client('ec2')
+def parse_ids(ids):
+    # Split a comma separated argument, dropping blanks and duplicates while keeping the given order.
+    parsed_ids = []
+    for id in str(ids).split(','):
+        id = id.strip()
+        if id and id not in parsed_ids:
+            parsed_ids.append(id)
+    return parsed_ids
 
-client.modify_image_attribute(
-    ImageId=ami_id,
-    OperationType='add',
-    LaunchPermission={
-        'Add': [
-            {
-                'UserId': account_id
-            }
-        ]
-    }
-)
+ami_ids = parse_ids(args.ami_ids)
+account_ids = parse_ids(args.account_ids)
+# An empty ImageIds list makes describe_images return every launchable image, so never send one.
+if not ami_ids:
+    parser.error("at least one AMI id is required")
+if not account_ids:
+    parser.error("at least one account ID is required")
+# Low level boto3 clients are thread safe, so a single client is shared by every worker.
+ec2_client = client('ec2')
+
+def main():
+    # Unknown or malformed AMI ids make the whole call fail with an InvalidAMIID.* error.
+    try:
+        images = ec2_client.describe_images(ImageIds=ami_ids)['Images']
+    except ClientError as error:
+        print('Unable to describe AMIs: {}'.format(error.response['Error']['Message']))
+        exit(1)
+
+    # Recently deregistered AMIs are silently left out of the response instead of raising.
+    results = {}
+    for ami_id in set(ami_ids) - set(image['ImageId'] for image in images):
+        results[ami_id] = 'FAILED: not found'
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = dict((executor.submit(share_image, ec2_client, image, account_ids), image['ImageId']) for image in images)
+
+        for future, ami_id in futures.items():
+            try:
+                future.result()
+                results[ami_id] = 'SUCCESS'
+            except Exception as error:
+                results[ami_id] = 'FAILED: {}'.format(error)
+
+    promoted_ids = [ami_id for ami_id in ami_ids if results[ami_id] == 'SUCCESS']
+    if promoted_ids:
+        try:
+            tag_images(ec2_client, promoted_ids)
+        except Exception as error:
+            # The images are already shared at this point, so report that rather than losing it.
+            for ami_id in promoted_ids:
+                results[ami_id] = 'SHARED, TAGGING FAILED: {}'.format(error)
 
-ami_details = client.describe_images(
-    ExecutableUsers=[account_id],
-    ImageIds=[ami_id]
-)
+    print('Promotion summary:')
+    for ami_id in ami_ids:
+        print('  {}: {}'.format(ami_id, results[ami_id]))
 
-snapshot_id = ami_details['Images'][0]['BlockDeviceMappings'][0]['Ebs']['SnapshotId']
+    if any(result != 'SUCCESS' for result in results.values()):
+        exit(1)
 
-client.modify_snapshot_attribute(
-    CreateVolumePermission={
-        'Add':[
+
+def share_image(client, image, account_ids):
+    # Every account is granted access in a single call per resource.
+    permissions = [{'UserId': account_id} for account_id in account_ids]
+
+    print('Sharing AMI: {} with account IDs: {}'.format(image['ImageId'], ', '.join(account_ids)))
+    client.modify_image_attribute(
+        ImageId=image['ImageId'],
+        OperationType='add',
+        LaunchPermission={
+            'Add': permissions
+        }
+    )
+
+    # Instance store and ephemeral mappings have no 'Ebs' key and no snapshot to share.
+    for mapping in image['BlockDeviceMappings']:
+        snapshot_id = mapping.get('Ebs', {}).get('SnapshotId')
+        if not snapshot_id:
+            continue
+
+        print('Sharing snapshot: {} of AMI: {}'.format(snapshot_id, image['ImageId']))
+        client.modify_snapshot_attribute(
+            CreateVolumePermission={
+                'Add': permissions
+            },
+            OperationType='add',
+            SnapshotId=snapshot_id
+        )
+
+
+def tag_images(client, image_ids):
+    client.create_tags(
+        Resources=image_ids,
+        Tags=[
             {
-                'UserId': account_id
-            }
+                'Key': 'PromotedtoProd',
+                'Value': 'true'
+            },
         ]
-    },
-    OperationType='add',
-    SnapshotId=snapshot_id
-)
-
-client.create_tags(
-    Resources=[
-        ami_id
-    ],
-    Tags=[
-        {
-            'Key': 'PromotedtoProd',
-            'Value': 'true'
-        },
-    ]
-)
+    )
+
+
+if __name__ == '__main__':
+    main()